@@ -10,25 +10,108 @@ Optional env vars:
 - CLARITY_API_TOKEN
 - CLARITY_PROJECT_ID (default: vif42io02i)
 - CLARITY_LOOKBACK_DAYS (default: 3, allowed: 1..3)
+- METRICS_TTL_SECONDS (default: 300; skip the sync while metrics.json is fresher than this)
+- FORCE_REFRESH (set to 1 to ignore both caches, same as --force)
+- GA4_CACHE_TTL_SECONDS (default: 3600; reuse cached GA4 report responses younger than this,
+  capped at METRICS_TTL_SECONDS for the KPI/daily report)
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import functools
+import hashlib
 import json
 import os
-from datetime import datetime, timezone
+import tempfile
+import time
+from datetime import date, datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List
-
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
-from google.api_core.exceptions import GoogleAPICallError
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from google.analytics.data_v1beta import BetaAnalyticsDataAsyncClient
+from google.analytics.data_v1beta.services.beta_analytics_data.transports import (
+    BetaAnalyticsDataGrpcAsyncIOTransport,
+)
+from google.analytics.data_v1beta.types import (
+    BatchRunReportsRequest,
+    DateRange,
+    Dimension,
+    Metric,
+    MetricAggregation,
+    RunReportRequest,
+    RunReportResponse,
+)
+from google.api_core import retry, retry_async
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    GoogleAPICallError,
+    InternalServerError,
+    InvalidArgument,
+    ResourceExhausted,
+    RetryError,
+    ServiceUnavailable,
+)
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request as AuthRequest
 from google.oauth2 import service_account
 import requests
 
+try:
+    import orjson
+except ImportError:  # Optional: faster serialization, stdlib json otherwise.
+    orjson = None
+
 ROOT = Path(__file__).resolve().parents[1]
 OUTPUT = ROOT / "backoffice" / "metrics.json"
+GA4_CACHE_DIR = ROOT / ".cache" / "ga4"
 CLARITY_EXPORT_URL = "https://www.clarity.ms/export-data/api/v1/project-live-insights"
+# GA4 Data API accepts at most 5 requests per batchRunReports call.
+GA4_BATCH_SIZE = 5
+GA4_API_HOST = "analyticsdata.googleapis.com"
+GA4_SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
+GA4_CHANNEL_OPTIONS = [
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+GA4_CHANNEL_READY_TIMEOUT = 10
+# Transient GA4 failures are retried with jittered exponential backoff instead of failing the sync.
+GA4_RETRY = retry_async.AsyncRetry(
+    predicate=retry.if_exception_type(
+        ServiceUnavailable, DeadlineExceeded, InternalServerError, ResourceExhausted
+    ),
+    initial=1.0,
+    maximum=30.0,
+    multiplier=2.0,
+    timeout=120.0,
+)
+
+_CTA_BUCKETS = ("Spotify", "Apple Music", "Novela", "Instagram", "Regalo", "Música")
+_CTA_KEY_MAP = {
+    "release_spotify_click": "Spotify",
+    "release_apple_click": "Apple Music",
+    "quick_book_click": "Novela",
+    "quick_instagram_click": "Instagram",
+    "quick_gift_click": "Regalo",
+    "quick_music_click": "Música",
+}
+_KEY_EVENTS_FILTER = {
+    "filter": {
+        "field_name": "eventName",
+        "in_list_filter": {
+            "values": [
+                "cta_click",
+                "video_play",
+                "video_complete",
+                "scroll_depth",
+                "engaged_time",
+            ]
+        },
+    }
+}
 
 
 def _now_iso() -> str:
@@ -38,9 +121,18 @@ def _now_iso() -> str:
 def _load_existing_payload() -> Dict[str, Any]:
     if not OUTPUT.exists():
         return {}
+    try:
+        return json.loads(OUTPUT.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
 
 
 def _to_int(value: Any) -> int:
+    # GA4 integer metrics arrive as "123"; only fall back to float parsing for "123.0" and friends.
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
     try:
         return int(float(value))
     except Exception:
@@ -52,10 +144,6 @@ def _to_float(value: Any) -> float:
         return float(value)
     except Exception:
         return 0.0
-    try:
-        return json.loads(OUTPUT.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
 
 
 def _require_env(name: str) -> str:
@@ -65,36 +153,60 @@ def _require_env(name: str) -> str:
     return value
 
 
-def _get_client() -> tuple[BetaAnalyticsDataClient, str, int]:
+async def _get_client() -> tuple[BetaAnalyticsDataAsyncClient, str, int]:
     property_id = _require_env("GA4_PROPERTY_ID")
     sa_json_raw = _require_env("GCP_SA_KEY_JSON")
     lookback = int(os.getenv("GA4_LOOKBACK_DAYS", "30"))
 
     info = json.loads(sa_json_raw)
-    creds = service_account.Credentials.from_service_account_info(
-        info, scopes=["https://www.googleapis.com/auth/analytics.readonly"]
+    creds = service_account.Credentials.from_service_account_info(info, scopes=GA4_SCOPES)
+    # grpc.aio channels bind to the running event loop, so this must run inside it.
+    channel = BetaAnalyticsDataGrpcAsyncIOTransport.create_channel(
+        GA4_API_HOST, credentials=creds, scopes=GA4_SCOPES, options=GA4_CHANNEL_OPTIONS
     )
-    return BetaAnalyticsDataClient(credentials=creds), property_id, lookback
+    # Pay the OAuth token fetch and the TCP/TLS/HTTP2 setup once here instead of on the first
+    # report of the concurrent burst. Both run in parallel; the token refresh is blocking I/O.
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(asyncio.to_thread(creds.refresh, AuthRequest()), channel.channel_ready()),
+            timeout=GA4_CHANNEL_READY_TIMEOUT,
+        )
+    except (TimeoutError, RefreshError):
+        # Not fatal: the report calls will connect (and surface real errors) on their own.
+        pass
+    transport = BetaAnalyticsDataGrpcAsyncIOTransport(channel=channel)
+    return BetaAnalyticsDataAsyncClient(transport=transport), property_id, lookback
+
+
+@functools.lru_cache(maxsize=64)
+def _dim(name: str) -> Dimension:
+    return Dimension(name=name)
+
+
+@functools.lru_cache(maxsize=64)
+def _met(name: str) -> Metric:
+    return Metric(name=name)
 
 
-def _run_report(
-    client: BetaAnalyticsDataClient,
+def _build_report_request(
     property_id: str,
+    date_range: DateRange,
     *,
     dimensions: List[str],
     metrics: List[str],
-    days: int,
     order_metric_desc: str | None = None,
     limit: int | None = None,
     dimension_filter: Any | None = None,
-) -> Any:
+    metric_aggregations: List[MetricAggregation] | None = None,
+) -> RunReportRequest:
     req = RunReportRequest(
         property=f"properties/{property_id}",
-        dimensions=[Dimension(name=d) for d in dimensions],
-        metrics=[Metric(name=m) for m in metrics],
-        date_ranges=[DateRange(start_date=f"{days}daysAgo", end_date="today")],
+        dimensions=[_dim(d) for d in dimensions],
+        metrics=[_met(m) for m in metrics],
+        date_ranges=[date_range],
         limit=limit or 100,
         dimension_filter=dimension_filter,
+        metric_aggregations=metric_aggregations or [],
     )
 
     if order_metric_desc:
@@ -105,31 +217,149 @@ def _run_report(
             }
         ]
 
-    return client.run_report(req)
+    return req
 
 
-def _first_int(report: Any, metric_idx: int = 0) -> int:
-    if not report.rows:
+def _report_cache_path(req: RunReportRequest) -> Path:
+    # The serialized request covers property, dimensions, metrics, date range, order, limit and filter.
+    # The date range is relative ("30daysAgo".."today"), so the current date is part of the key too.
+    digest = hashlib.sha256(RunReportRequest.serialize(req))
+    digest.update(date.today().isoformat().encode("ascii"))
+    return GA4_CACHE_DIR / f"{digest.hexdigest()}.pb"
+
+
+def _load_cached_report(
+    req: RunReportRequest, ttl_seconds: int
+) -> Optional[Tuple[RunReportResponse, float]]:
+    path = _report_cache_path(req)
+    try:
+        fetched_at = path.stat().st_mtime
+        if time.time() - fetched_at >= ttl_seconds:
+            return None
+        return RunReportResponse.deserialize(path.read_bytes()), fetched_at
+    except Exception:
+        return None
+
+
+def _atomic_write_bytes(path: Path, data: Union[bytes, Iterable[bytes]], mode: Optional[int] = None) -> None:
+    # Write next to path and swap it in, so readers never see a truncated file and a failed
+    # write never leaves a stray temp file behind. data may be a chunk iterable for streaming.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            if isinstance(data, bytes):
+                tmp.write(data)
+            else:
+                tmp.writelines(data)
+        if mode is not None:
+            os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _store_cached_report(req: RunReportRequest, report: RunReportResponse) -> None:
+    try:
+        _atomic_write_bytes(_report_cache_path(req), RunReportResponse.serialize(report))
+    except OSError:
+        # The cache is best effort; a read-only checkout must not fail the sync.
+        pass
+
+
+def _marker_is_fresh(path: Path, ttl_seconds: int) -> bool:
+    try:
+        return time.time() - path.stat().st_mtime < ttl_seconds
+    except OSError:
+        return False
+
+
+def _touch_marker(path: Path) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    except OSError:
+        pass
+
+
+def _raise_first_error(results: List[Any]) -> None:
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def _run_cached_report(
+    client: BetaAnalyticsDataAsyncClient,
+    req: RunReportRequest,
+    *,
+    ttl_seconds: int,
+    force: bool = False,
+) -> Tuple[RunReportResponse, float]:
+    cached = None if force else _load_cached_report(req, ttl_seconds)
+    if cached is not None:
+        return cached
+    report = await client.run_report(req, retry=GA4_RETRY)
+    _store_cached_report(req, report)
+    return report, time.time()
+
+
+async def _run_batched_reports(
+    client: BetaAnalyticsDataAsyncClient,
+    property_id: str,
+    report_requests: List[Tuple[RunReportRequest, int]],
+    *,
+    force: bool = False,
+) -> Tuple[List[Any], float]:
+    # Returns the reports in request order plus the fetch time of the oldest one.
+    cached = [None if force else _load_cached_report(req, ttl) for req, ttl in report_requests]
+    reports: List[Any] = [hit[0] if hit else None for hit in cached]
+    fetched_at = [hit[1] for hit in cached if hit]
+    misses = [idx for idx, hit in enumerate(cached) if hit is None]
+    batches = [misses[start : start + GA4_BATCH_SIZE] for start in range(0, len(misses), GA4_BATCH_SIZE)]
+    responses = await asyncio.gather(
+        *[
+            client.batch_run_reports(
+                BatchRunReportsRequest(
+                    property=f"properties/{property_id}",
+                    requests=[report_requests[idx][0] for idx in batch],
+                ),
+                retry=GA4_RETRY,
+            )
+            for batch in batches
+        ],
+        return_exceptions=True,
+    )
+    _raise_first_error(responses)
+    for batch, response in zip(batches, responses):
+        for idx, report in zip(batch, response.reports):
+            _store_cached_report(report_requests[idx][0], report)
+            reports[idx] = report
+    if misses:
+        fetched_at.append(time.time())
+    return reports, min(fetched_at, default=time.time())
+
+
+def _total_int(report: Any, metric_idx: int = 0) -> int:
+    if not report.totals:
         return 0
-    return _to_int(report.rows[0].metric_values[metric_idx].value)
+    return _to_int(report.totals[0].metric_values[metric_idx].value)
 
 
-def _first_float(report: Any, metric_idx: int = 0) -> float:
-    if not report.rows:
+def _total_float(report: Any, metric_idx: int = 0) -> float:
+    if not report.totals:
         return 0.0
-    return _to_float(report.rows[0].metric_values[metric_idx].value)
+    return _to_float(report.totals[0].metric_values[metric_idx].value)
 
 
 def _rows_to_named_pairs(report: Any, name_key: str, value_metric_idx: int = 0) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for row in report.rows:
-        out.append(
-            {
-                name_key: row.dimension_values[0].value,
-                "count": _to_int(row.metric_values[value_metric_idx].value),
-            }
-        )
-    return out
+    return [
+        {
+            name_key: row.dimension_values[0].value,
+            "count": _to_int(row.metric_values[value_metric_idx].value),
+        }
+        for row in report.rows
+    ]
 
 
 def _daily_series(report: Any) -> Dict[str, List[Any]]:
@@ -137,12 +367,15 @@ def _daily_series(report: Any) -> Dict[str, List[Any]]:
     sessions: List[int] = []
     users: List[int] = []
 
+    labels_append = labels.append
+    sessions_append = sessions.append
+    users_append = users.append
     for row in report.rows:
         raw = row.dimension_values[0].value  # YYYYMMDD
-        label = f"{raw[6:8]}/{raw[4:6]}"
-        labels.append(label)
-        sessions.append(_to_int(row.metric_values[0].value))
-        users.append(_to_int(row.metric_values[1].value))
+        mv = row.metric_values
+        labels_append(f"{raw[6:8]}/{raw[4:6]}")
+        sessions_append(_to_int(mv[0].value))
+        users_append(_to_int(mv[1].value))
 
     return {"labels": labels, "sessions": sessions, "users": users}
 
@@ -317,158 +550,168 @@ def _fetch_clarity_metrics() -> Dict[str, Any]:
     return clarity
 
 
-def build_metrics() -> Dict[str, Any]:
-    client, property_id, lookback = _get_client()
-
-    summary = _run_report(
-        client,
-        property_id,
-        dimensions=["date"],
-        metrics=["totalUsers", "sessions", "engagementRate", "screenPageViews"],
-        days=lookback,
-        limit=1,
-    )
-
-    # aggregate summary using total metric report (no dimensions)
-    totals = client.run_report(
-        RunReportRequest(
-            property=f"properties/{property_id}",
-            metrics=[
-                Metric(name="totalUsers"),
-                Metric(name="sessions"),
-                Metric(name="engagementRate"),
-                Metric(name="screenPageViews"),
-            ],
-            date_ranges=[DateRange(start_date=f"{lookback}daysAgo", end_date="today")],
-        )
-    )
-
-    total_users = _first_int(totals, 0)
-    total_sessions = _first_int(totals, 1)
-    engagement_rate = _first_float(totals, 2)
-    total_views = _first_int(totals, 3)
-
-    daily = _run_report(
-        client,
-        property_id,
-        dimensions=["date"],
-        metrics=["sessions", "totalUsers"],
-        days=lookback,
-        order_metric_desc=None,
-        limit=lookback + 2,
-    )
-
-    pages = _run_report(
-        client,
-        property_id,
-        dimensions=["pagePath"],
-        metrics=["screenPageViews"],
-        days=lookback,
-        order_metric_desc="screenPageViews",
-        limit=10,
-    )
+async def build_metrics(metrics_ttl: int, force: bool = False) -> Dict[str, Any]:
+    client, property_id, lookback = await _get_client()
+    try:
+        return await _build_metrics(client, property_id, lookback, metrics_ttl=metrics_ttl, force=force)
+    finally:
+        await client.transport.close()
+
+
+async def _build_metrics(
+    client: BetaAnalyticsDataAsyncClient, property_id: str, lookback: int, *, metrics_ttl: int, force: bool
+) -> Dict[str, Any]:
+    cache_ttl = int(os.getenv("GA4_CACHE_TTL_SECONDS", "3600"))
+    # The KPIs and daily series include today's partial data, so keep them as fresh as metrics.json.
+    kpi_ttl = min(cache_ttl, metrics_ttl)
+    date_range = DateRange(start_date=f"{lookback}daysAgo", end_date="today")
+
+    # (request, cache TTL) pairs, sent together through batchRunReports.
+    report_requests = [
+        (
+            # Daily series; the TOTAL aggregation also yields the window KPIs computed server-side,
+            # so users stay de-duplicated across days instead of being summed per day.
+            _build_report_request(
+                property_id,
+                date_range,
+                dimensions=["date"],
+                metrics=["sessions", "totalUsers", "engagementRate", "screenPageViews"],
+                order_metric_desc=None,
+                limit=lookback + 2,
+                metric_aggregations=[MetricAggregation.TOTAL],
+            ),
+            kpi_ttl,
+        ),
+        (
+            _build_report_request(
+                property_id,
+                date_range,
+                dimensions=["pagePath"],
+                metrics=["screenPageViews"],
+                order_metric_desc="screenPageViews",
+                limit=10,
+            ),
+            cache_ttl,
+        ),
+        (
+            _build_report_request(
+                property_id,
+                date_range,
+                dimensions=["country"],
+                metrics=["totalUsers"],
+                order_metric_desc="totalUsers",
+                limit=8,
+            ),
+            cache_ttl,
+        ),
+        (
+            _build_report_request(
+                property_id,
+                date_range,
+                dimensions=["deviceCategory"],
+                metrics=["totalUsers"],
+                order_metric_desc="totalUsers",
+                limit=5,
+            ),
+            cache_ttl,
+        ),
+        (
+            _build_report_request(
+                property_id,
+                date_range,
+                dimensions=["sessionDefaultChannelGroup"],
+                metrics=["sessions"],
+                order_metric_desc="sessions",
+                limit=8,
+            ),
+            cache_ttl,
+        ),
+    ]
 
-    countries = _run_report(
-        client,
+    # Preferred: one eventName x cta_name report feeds both events and cta_breakdown.
+    # It only works once the customEvent:cta_name dimension is registered in the GA4 property;
+    # until then the plain eventName report below is used instead.
+    events_request = _build_report_request(
         property_id,
-        dimensions=["country"],
-        metrics=["totalUsers"],
-        days=lookback,
-        order_metric_desc="totalUsers",
-        limit=8,
+        date_range,
+        dimensions=["eventName", "customEvent:cta_name"],
+        metrics=["eventCount"],
+        order_metric_desc="eventCount",
+        dimension_filter=_KEY_EVENTS_FILTER,
     )
-
-    devices = _run_report(
-        client,
+    key_events_request = _build_report_request(
         property_id,
-        dimensions=["deviceCategory"],
-        metrics=["totalUsers"],
-        days=lookback,
-        order_metric_desc="totalUsers",
-        limit=5,
+        date_range,
+        dimensions=["eventName"],
+        metrics=["eventCount"],
+        order_metric_desc="eventCount",
+        limit=20,
+        dimension_filter=_KEY_EVENTS_FILTER,
     )
-
-    channels = _run_report(
-        client,
-        property_id,
-        dimensions=["sessionDefaultChannelGroup"],
-        metrics=["sessions"],
-        days=lookback,
-        order_metric_desc="sessions",
-        limit=8,
+    # Remembers that the combined report was rejected, so later local runs go straight to the
+    # plain report (the marker does not survive CI checkouts, where .cache/ starts empty).
+    unsupported_marker = _report_cache_path(events_request).with_suffix(".unsupported")
+    skip_combined = not force and _marker_is_fresh(unsupported_marker, cache_ttl)
+    # The events reports also feed the cta_clicks_7d KPI, so they share the KPI TTL.
+    events_call = _run_cached_report(
+        client, key_events_request if skip_combined else events_request, ttl_seconds=kpi_ttl, force=force
     )
 
-    key_events = client.run_report(
-        RunReportRequest(
-            property=f"properties/{property_id}",
-            dimensions=[Dimension(name="eventName")],
-            metrics=[Metric(name="eventCount")],
-            date_ranges=[DateRange(start_date=f"{lookback}daysAgo", end_date="today")],
-            dimension_filter={
-                "filter": {
-                    "field_name": "eventName",
-                    "in_list_filter": {
-                        "values": [
-                            "cta_click",
-                            "video_play",
-                            "video_complete",
-                            "scroll_depth",
-                            "engaged_time",
-                        ]
-                    },
-                }
-            },
-            order_bys=[{"metric": {"metric_name": "eventCount"}, "desc": True}],
-            limit=20,
-        )
+    # The report calls are independent and network-bound, so run them concurrently.
+    # Clarity uses blocking requests, so it gets a worker thread alongside the GA4 calls.
+    clarity, batched, events_result = await asyncio.gather(
+        asyncio.to_thread(_fetch_clarity_metrics),
+        _run_batched_reports(client, property_id, report_requests, force=force),
+        events_call,
+        return_exceptions=True,
     )
-
-    cta_breakdown: Dict[str, int] = {
-        "Spotify": 0,
-        "Apple Music": 0,
-        "Novela": 0,
-        "Instagram": 0,
-        "Regalo": 0,
-        "Música": 0,
-    }
-
-    # Optional: if custom dimension customEvent:cta_name is available in GA4 property.
-    try:
-        cta_report = _run_report(
-            client,
-            property_id,
-            dimensions=["customEvent:cta_name"],
-            metrics=["eventCount"],
-            days=lookback,
-            order_metric_desc="eventCount",
-            limit=20,
-            dimension_filter={
-                "filter": {
-                    "field_name": "eventName",
-                    "string_filter": {"value": "cta_click", "match_type": "EXACT"},
-                }
-            },
+    _raise_first_error([clarity, batched])
+    (daily, pages, countries, devices, channels), data_as_of = batched
+
+    key_events_result = None
+    if skip_combined:
+        key_events_result, events_result = events_result, None
+    elif isinstance(events_result, InvalidArgument):
+        # customEvent:cta_name is not registered yet: one extra round-trip for the plain report.
+        _touch_marker(unsupported_marker)
+        events_result = None
+        key_events_result = await _run_cached_report(
+            client, key_events_request, ttl_seconds=kpi_ttl, force=force
         )
-        for row in cta_report.rows:
-            key = row.dimension_values[0].value
-            val = int(float(row.metric_values[0].value))
-            mapped = {
-                "release_spotify_click": "Spotify",
-                "release_apple_click": "Apple Music",
-                "quick_book_click": "Novela",
-                "quick_instagram_click": "Instagram",
-                "quick_gift_click": "Regalo",
-                "quick_music_click": "Música",
-            }.get(key)
-            if mapped:
-                cta_breakdown[mapped] = val
-    except Exception:
-        # Graceful fallback when custom dimension is not registered yet.
-        pass
+    _raise_first_error([events_result, key_events_result])
+
+    total_sessions = _total_int(daily, 0)
+    total_users = _total_int(daily, 1)
+    engagement_rate = _total_float(daily, 2)
+    total_views = _total_int(daily, 3)
+
+    cta_breakdown: Dict[str, int] = dict.fromkeys(_CTA_BUCKETS, 0)
+    event_counts: Dict[str, int] = {}
+
+    if events_result is not None:
+        events_report, events_fetched_at = events_result
+        data_as_of = min(data_as_of, events_fetched_at)
+        for row in events_report.rows:
+            dv = row.dimension_values
+            name = dv[0].value
+            val = _to_int(row.metric_values[0].value)
+            event_counts[name] = event_counts.get(name, 0) + val
+            if name == "cta_click":
+                mapped = _CTA_KEY_MAP.get(dv[1].value)
+                if mapped:
+                    cta_breakdown[mapped] += val
+    else:
+        # Graceful fallback when custom dimension is not registered yet: plain eventName report,
+        # cta_breakdown stays at zero since any cta_name report would fail the same way.
+        key_events, events_fetched_at = key_events_result
+        data_as_of = min(data_as_of, events_fetched_at)
+        event_counts = {
+            row.dimension_values[0].value: _to_int(row.metric_values[0].value) for row in key_events.rows
+        }
 
     events = [
-        {"name": row.dimension_values[0].value, "count": int(float(row.metric_values[0].value))}
-        for row in key_events.rows
+        {"name": name, "count": count}
+        for name, count in sorted(event_counts.items(), key=lambda item: item[1], reverse=True)
     ]
 
     top_pages = [
@@ -476,8 +719,6 @@ def build_metrics() -> Dict[str, Any]:
         for row in pages.rows
     ]
 
-    clarity = _fetch_clarity_metrics()
-
     return {
         "last_updated": _now_iso(),
         "window_days": lookback,
@@ -485,7 +726,8 @@ def build_metrics() -> Dict[str, Any]:
             "users_7d": total_users,
             "sessions_7d": total_sessions,
             "engagement_rate": engagement_rate,
-            "cta_clicks_7d": sum(cta_breakdown.values()),
+            # All cta_click events, including cta_names outside _CTA_KEY_MAP (and without the custom dimension).
+            "cta_clicks_7d": event_counts.get("cta_click", 0),
             "pageviews_7d": total_views,
         },
         "series": _daily_series(daily),
@@ -505,6 +747,8 @@ def build_metrics() -> Dict[str, Any]:
             "status": "ok",
             "message": "Metrics updated from GA4 successfully.",
             "last_attempted": _now_iso(),
+            # When the oldest GA4 report used here was fetched (older than last_updated on cache hits).
+            "data_as_of": datetime.fromtimestamp(data_as_of, timezone.utc).isoformat(),
         },
     }
 
@@ -539,13 +783,51 @@ def build_error_payload(exc: Exception) -> Dict[str, Any]:
     return payload
 
 
+def _write_payload(payload: Dict[str, Any]) -> None:
+    data: Union[bytes, Iterable[bytes]]
+    if orjson is not None:
+        data = orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        # Stream the encoder output instead of materializing the whole document first.
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+        data = (chunk.encode("utf-8") for chunk in encoder.iterencode(payload))
+    # mkstemp creates 0600 files; metrics.json is served by the web server.
+    _atomic_write_bytes(OUTPUT, data, mode=0o644)
+
+
+def _is_fresh(ttl_seconds: int) -> bool:
+    # Use the payload timestamp rather than the file mtime: a fresh checkout resets mtime.
+    existing = _load_existing_payload()
+    if not isinstance(existing, dict):
+        return False
+    sync = existing.get("sync")
+    if not isinstance(sync, dict) or sync.get("status") != "ok":
+        return False
+    try:
+        last_updated = datetime.fromisoformat(existing["last_updated"])
+        # Naive timestamps raise TypeError here and are treated as stale.
+        return (datetime.now(timezone.utc) - last_updated).total_seconds() < ttl_seconds
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="Ignore cached metrics and GA4 reports and resync.")
+    args = parser.parse_args()
+
+    force = args.force or os.getenv("FORCE_REFRESH") == "1"
     try:
-        payload = build_metrics()
-    except (GoogleAPICallError, RuntimeError, ValueError, KeyError, json.JSONDecodeError) as exc:
+        # Parsed inside the try so a malformed value is recorded in the error payload.
+        metrics_ttl = int(os.getenv("METRICS_TTL_SECONDS", "300"))
+        if not force and _is_fresh(metrics_ttl):
+            print(f"{OUTPUT} is fresh, using cached metrics")
+            return
+        payload = asyncio.run(build_metrics(metrics_ttl, force=force))
+    # RetryError (GA4_RETRY ran out of time) is a GoogleAPIError but not a GoogleAPICallError.
+    except (GoogleAPICallError, RetryError, RuntimeError, ValueError, KeyError, json.JSONDecodeError) as exc:
         payload = build_error_payload(exc)
-    OUTPUT.parent.mkdir(parents=True, exist_ok=True)
-    OUTPUT.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_payload(payload)
     print(f"Updated {OUTPUT}")
 
 